@@ -0,0 +1,72 @@
+"""Single-flight coalescing and versioned page cache for list queries.
+
+Every collection has a write version that handlers bump after a mutation.
+List results are cached under ``(collection, version, key)``, so a write makes
+older pages unreachable without explicit invalidation, and concurrent
+identical misses share one in-flight loader call.
+
+Versions are per process, so writes made by another worker never reach this
+cache; ``ttl`` (``PAGE_CACHE_TTL``) bounds how stale such a page can be.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class QueryCache:
+    def __init__(self, max_entries: int = 512, ttl: float = 0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.versions: Dict[str, int] = {}
+        self._pages: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Tuple, asyncio.Task] = {}
+
+    def version(self, collection: str) -> int:
+        return self.versions.get(collection, 0)
+
+    def bump(self, collection: str) -> None:
+        self.versions[collection] = self.version(collection) + 1
+
+    def _lookup(self, key):
+        hit = self._pages.get(key)
+        if hit is None:
+            return None
+        stored_at, value = hit
+        if self.ttl and time.monotonic() - stored_at > self.ttl:
+            del self._pages[key]
+            return None
+        self._pages.move_to_end(key)
+        return hit
+
+    def _store(self, key, value):
+        self._pages[key] = (time.monotonic(), value)
+        self._pages.move_to_end(key)
+        while len(self._pages) > self.max_entries:
+            self._pages.popitem(last=False)
+
+    async def get_or_load(self, collection: str, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached page for ``key`` or run ``loader`` once for all concurrent callers."""
+        full_key = (collection, self.version(collection), key)
+        hit = self._lookup(full_key)
+        if hit is not None:
+            return hit[1]
+        task = self._inflight.get(full_key)
+        if task is None:
+            # The load runs as its own task so one caller disconnecting
+            # doesn't cancel it for everyone else waiting on it.
+            task = asyncio.ensure_future(self._load(full_key, loader))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[full_key] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, full_key, loader):
+        try:
+            value = await loader()
+        finally:
+            del self._inflight[full_key]
+        collection, version, _ = full_key
+        # Skip caching when a write landed while loading; that page is already stale
+        if self.version(collection) == version:
+            self._store(full_key, value)
+        return value
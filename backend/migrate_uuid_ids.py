@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Migrate string UUID ids to BSON UUIDs (Binary subtype 4)
+
+Rewrites each document whose _id is a UUID string so _id is stored once as a
+binary UUID and the duplicated id field is dropped, then reports collection
+and _id index sizes before and after. Run it alongside the live app with
+ID_STORAGE=binary; the app matches both id forms while this runs.
+
+Each document is swapped on its own: insert the binary copy, then delete the
+string original only if its version/updated_at are still what was read. If
+the app updated or deleted the original in between, the copy is withdrawn and
+the swap retried from a fresh read, so no write is lost and no deleted
+document comes back. Documents that keep changing are left as they are and
+reported as conflicts; re-run to pick them up. A list request landing between
+the two steps can still see a document twice. Batches only pace the work,
+with a pause between them to limit load. Re-running is safe: already-migrated
+documents are skipped and copies left by an interrupted run are reconciled.
+
+Usage: python migrate_uuid_ids.py [--batch-size 500] [--pause 0.05] [--compact]
+"""
+
+import argparse
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
+
+from storage import COLLECTIONS
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+def collection_stats(db, name):
+    stats = db.command("collStats", name)
+    return {
+        "count": stats.get("count", 0),
+        "size": stats.get("size", 0),
+        "id_index": stats.get("indexSizes", {}).get("_id_", 0),
+        "total_index": stats.get("totalIndexSize", 0),
+    }
+
+def to_binary_doc(doc):
+    try:
+        new_id = uuid.UUID(doc["_id"])
+    except ValueError:
+        return None
+    new = {k: v for k, v in doc.items() if k != "id"}
+    new["_id"] = new_id
+    return new
+
+# Fields the app changes on every write; the original is only removed while they match
+GUARD_FIELDS = ("updated_at", "version")
+
+def unchanged(doc):
+    """Filter matching ``doc`` only while its guard fields are as read."""
+    return {"_id": doc["_id"], **{k: doc.get(k) for k in GUARD_FIELDS}}
+
+def revision(doc):
+    return (doc.get("version") or 0, doc.get("updated_at") or datetime.min)
+
+def swap_document(coll, doc, retries=5):
+    """Replace one string-id document by its binary copy.
+
+    Returns "migrated", "gone" (the app deleted it meanwhile) or "conflict".
+    """
+    for _ in range(retries):
+        new = to_binary_doc(doc)
+        try:
+            coll.insert_one(new)
+        except DuplicateKeyError:
+            # A copy from an interrupted run, possibly written to by the app since
+            copy = coll.find_one({"_id": new["_id"]})
+            if copy is not None and revision(copy) >= revision(new):
+                new = copy
+            elif copy is None or not coll.replace_one(unchanged(copy), new).matched_count:
+                doc = coll.find_one({"_id": doc["_id"]})
+                if doc is None:
+                    return "gone"
+                continue
+        if coll.delete_one(unchanged(doc)).deleted_count:
+            return "migrated"
+        # The original changed or vanished after it was read: withdraw the
+        # copy (unless the app has written to it since) and start over.
+        coll.delete_one(unchanged(new))
+        doc = coll.find_one({"_id": doc["_id"]})
+        if doc is None:
+            return "gone"
+    return "conflict"
+
+def migrate_collection(coll, batch_size, pause, dry_run):
+    """Move string-id documents over in _id order; returns outcome counts."""
+    counts = {"migrated": 0, "skipped": 0, "gone": 0, "conflict": 0}
+    last = ""
+    while True:
+        batch = list(coll.find({"_id": {"$type": "string", "$gt": last}}).sort("_id", 1).limit(batch_size))
+        if not batch:
+            return counts
+        last = batch[-1]["_id"]
+        for doc in batch:
+            if to_binary_doc(doc) is None:
+                counts["skipped"] += 1
+            elif dry_run:
+                counts["migrated"] += 1
+            else:
+                counts[swap_document(coll, doc)] += 1
+        if pause:
+            time.sleep(pause)
+
+def fmt_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024:
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n /= 1024
+    return f"{n:.1f}TB"
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate string UUID ids to BSON UUIDs")
+    parser.add_argument("--collections", default=",".join(COLLECTIONS))
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.05, help="seconds to sleep between batches")
+    parser.add_argument("--compact", action="store_true",
+                        help="run compact afterwards so freed index/storage space shows up in the report")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    client = MongoClient(os.environ['MONGO_URL'], uuidRepresentation="standard")
+    db = client[os.environ['DB_NAME']]
+    existing = set(db.list_collection_names())
+    names = [n.strip() for n in args.collections.split(",") if n.strip() in existing]
+
+    report = []
+    for name in names:
+        before = collection_stats(db, name)
+        counts = migrate_collection(db[name], args.batch_size, args.pause, args.dry_run)
+        if args.compact and not args.dry_run:
+            db.command("compact", name)
+        after = collection_stats(db, name)
+        report.append((name, before, after))
+        print(f"{name}: migrated {counts['migrated']}, skipped {counts['skipped']} non-UUID ids, "
+              f"{counts['gone']} deleted by the app meanwhile, {counts['conflict']} conflicts")
+
+    print("\nCollection     docs   data before -> after      _id index before -> after")
+    for name, before, after in report:
+        print(f"{name:13s} {after['count']:6d}   {fmt_bytes(before['size']):>9s} -> {fmt_bytes(after['size']):<9s}"
+              f"   {fmt_bytes(before['id_index']):>9s} -> {fmt_bytes(after['id_index'])}")
+    if not args.compact:
+        print("\nIndex sizes only shrink once WiredTiger reclaims pages; re-run with --compact to see the full effect.")
+    client.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+"""On-demand sampling profiler for individual requests.
+
+Enabled only when ``PROFILER_ADMIN_TOKEN`` is set; otherwise nothing is
+installed and requests take the normal path. A request is profiled when it
+sends ``X-Profile: 1`` with a matching ``X-Admin-Token``, or when its route is
+sampled via ``PROFILE_SAMPLE``: ``/api/blogs=100,/api/blogs/{id}=50`` profiles
+one in N requests per route template, and a key ending in ``*`` matches a path
+prefix (``/api/community/*=20``).
+
+While a request is profiled, a background thread samples the event loop
+thread every ``PROFILE_INTERVAL_MS``. Samples are asyncio-aware: the request
+task and any tasks it spawns (``gather``, cache loads) are tracked. A task
+running on the loop is recorded with its real thread stack; a suspended one
+by its coroutine await chain ending in an ``<await ...>`` leaf, so time spent
+waiting on Motor shows up under the handler that awaited it. Finished
+profiles are kept in a bounded store and exported as collapsed stacks or
+speedscope JSON.
+"""
+import asyncio
+import contextvars
+import hmac
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from starlette.routing import Match
+
+Frame = Tuple[str, str, int]
+
+_session: contextvars.ContextVar = contextvars.ContextVar("profile_session", default=None)
+
+
+def _label(code) -> Frame:
+    name = getattr(code, "co_qualname", code.co_name)
+    path = code.co_filename.replace(os.sep, "/")
+    return (name, "/".join(path.split("/")[-2:]), code.co_firstlineno)
+
+
+def _thread_frames(frame) -> List[Any]:
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def _await_chain(coro) -> Tuple[List[Any], str]:
+    """Frames of a suspended coroutine chain and a label for what it waits on."""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            return frames, "<done>"
+        frames.append(frame)
+        nxt = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+        if nxt is None:
+            return frames, "<ready>"
+        if not hasattr(nxt, "cr_frame") and not hasattr(nxt, "gi_frame"):
+            return frames, f"<await {type(nxt).__name__}>"
+        coro = nxt
+    return frames, "<ready>"
+
+
+class ProfileSession:
+    def __init__(self, method: str, path: str, interval: float):
+        self.id = str(uuid.uuid4())
+        self.method = method
+        self.path = path
+        self.interval = interval
+        self.started_at = datetime.utcnow()
+        self.duration_ms = 0.0
+        self.status: Optional[int] = None
+        self.tasks: List[asyncio.Task] = []
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._commit = threading.Lock()
+        self._thread_id = threading.get_ident()
+
+    def _sample(self):
+        thread_frame = sys._current_frames().get(self._thread_id)
+        on_thread = _thread_frames(thread_frame)
+        positions = {id(f): i for i, f in enumerate(on_thread)}
+        root = (f"{self.method} {self.path}", "", 0)
+        live = [(n, t) for n, t in enumerate(list(self.tasks)) if not t.done()]
+        picked = []
+        for i, (n, task) in enumerate(live):
+            coro = task.get_coro()
+            start = getattr(coro, "cr_frame", None)
+            if start is not None and id(start) in positions:
+                # Running right now: the real thread stack includes any sync
+                # calls (Pydantic validation, serialization) below the handler.
+                picked = [(n, task, on_thread[positions[id(start)]:], None)]
+                break
+            frames, leaf = _await_chain(coro)
+            # A task blocked while tasks it spawned are still alive is waiting
+            # on them; count that time once, under the children.
+            if i + 1 < len(live) and leaf.startswith("<await"):
+                continue
+            picked.append((n, task, frames, leaf))
+        stacks = []
+        for n, task, frames, leaf in picked:
+            stack = [root]
+            if n:
+                stack.append((f"<task {task.get_name()}>", "", 0))
+            stack.extend(_label(f.f_code) for f in frames)
+            if leaf:
+                stack.append((leaf, "", 0))
+            stacks.append(tuple(stack))
+        with self._commit:
+            # A tick that finishes after the handler returned belongs to no request
+            if self._stop.is_set():
+                return
+            self.stacks.update(stacks)
+            self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self._sample()
+            except Exception:
+                # Frames mutate under us while the loop runs; drop that tick
+                continue
+
+    def start(self):
+        self._t0 = time.perf_counter()
+        threading.Thread(target=self._run, name=f"profiler-{self.id[:8]}", daemon=True).start()
+
+    def stop(self):
+        # No join: the sampler exits on its own, and once the flag is set under
+        # the lock it can no longer touch the stacks being exported. Dropping the
+        # tasks keeps stored profiles from pinning their results and tracebacks.
+        with self._commit:
+            self._stop.set()
+            self.tasks = []
+        self.duration_ms = (time.perf_counter() - self._t0) * 1000
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id, "method": self.method, "path": self.path, "status": self.status,
+            "started_at": self.started_at, "duration_ms": round(self.duration_ms, 3), "samples": self.samples,
+        }
+
+    def collapsed(self) -> str:
+        """Brendan Gregg collapsed-stack format, one ``a;b;c count`` line per stack."""
+        lines = []
+        for stack, count in self.stacks.most_common():
+            names = [f"{name} ({path}:{line})" if path else name for name, path, line in stack]
+            lines.append(f"{';'.join(names)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self) -> Dict[str, Any]:
+        frames: Dict[Frame, int] = {}
+        samples, weights = [], []
+        for stack, count in self.stacks.items():
+            samples.append([frames.setdefault(f, len(frames)) for f in stack])
+            weights.append(count * self.interval * 1000)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{self.method} {self.path}",
+            "exporter": "backend/profiler.py",
+            "shared": {"frames": [
+                {"name": name, "file": path, "line": line} if path else {"name": name}
+                for name, path, line in frames
+            ]},
+            "profiles": [{
+                "type": "sampled", "name": f"{self.method} {self.path} {self.id}", "unit": "milliseconds",
+                "startValue": 0, "endValue": sum(weights), "samples": samples, "weights": weights,
+            }],
+        }
+
+
+class Profiler:
+    def __init__(self, admin_token: str, sample_rates: Dict[str, int], interval: float, max_profiles: int = 50):
+        self.admin_token = admin_token
+        self.sample_rates = sample_rates
+        self.interval = interval
+        self.profiles: "deque[ProfileSession]" = deque(maxlen=max_profiles)
+        self.routes: Sequence[Any] = ()
+        self._counters: Counter = Counter()
+
+    @classmethod
+    def from_env(cls, env) -> Optional["Profiler"]:
+        token = env.get("PROFILER_ADMIN_TOKEN")
+        if not token:
+            return None
+        rates = {}
+        for item in env.get("PROFILE_SAMPLE", "").split(","):
+            if "=" in item:
+                path, n = item.split("=", 1)
+                rates[path.strip()] = max(int(n), 1)
+        return cls(token, rates, float(env.get("PROFILE_INTERVAL_MS", 5)) / 1000,
+                   int(env.get("PROFILE_STORE_SIZE", 50)))
+
+    def is_admin(self, token: Optional[str]) -> bool:
+        return bool(token) and hmac.compare_digest(token.encode(), self.admin_token.encode())
+
+    def wants(self, scope) -> bool:
+        headers = dict(scope.get("headers") or ())
+        if headers.get(b"x-profile") == b"1":
+            return self.is_admin(headers.get(b"x-admin-token", b"").decode("latin-1"))
+        key = self._sample_key(scope) if self.sample_rates else None
+        if key is None:
+            return False
+        self._counters[key] += 1
+        return self._counters[key] % self.sample_rates[key] == 0
+
+    def _sample_key(self, scope) -> Optional[str]:
+        """The ``PROFILE_SAMPLE`` key covering this request: route template, then prefix."""
+        path = scope["path"]
+        if path in self.sample_rates:
+            return path
+        for route in self.routes:
+            template = getattr(route, "path", None)
+            if template in self.sample_rates and route.matches(scope)[0] != Match.NONE:
+                return template
+        for key in self.sample_rates:
+            if key.endswith("*") and path.startswith(key[:-1]):
+                return key
+        return None
+
+    def get(self, profile_id: str) -> Optional[ProfileSession]:
+        return next((p for p in self.profiles if p.id == profile_id), None)
+
+    def install_task_factory(self, loop) -> None:
+        """Record tasks spawned while a profiled request is active."""
+        previous = loop.get_task_factory()
+
+        def factory(loop, coro, **kwargs):
+            if previous is not None:
+                task = previous(loop, coro, **kwargs)
+            else:
+                task = asyncio.Task(coro, loop=loop, **kwargs)
+            session = _session.get()
+            # Spawned tasks inherit the context, so they may outlive the request
+            if session is not None and not session._stop.is_set():
+                session.tasks.append(task)
+            return task
+
+        loop.set_task_factory(factory)
+
+
+class ProfilerMiddleware:
+    """Pure ASGI middleware so the handler runs in the request's own task."""
+
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.wants(scope):
+            return await self.app(scope, receive, send)
+
+        session = ProfileSession(scope["method"], scope["path"], self.profiler.interval)
+        session.tasks.append(asyncio.current_task())
+        token = _session.set(session)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                session.status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", session.id.encode())]
+            await send(message)
+
+        session.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            session.stop()
+            _session.reset(token)
+            self.profiler.profiles.append(session)
@@ -1,7 +1,9 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Query
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Header, Response, Depends, Request
+from fastapi.responses import PlainTextResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
+import json
 import os
 import logging
 from pathlib import Path
@@ -9,15 +11,27 @@ from pydantic import BaseModel, Field, ConfigDict
 from typing import List, Optional, Dict, Any
 import uuid
 from datetime import datetime
+from urllib.parse import unquote, urlencode, urlsplit
+
+from cache import QueryCache
+from profiler import Profiler, ProfilerMiddleware
+from storage import create_storage
 
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Storage (MongoDB by default, STORAGE_BACKEND=memory for the embedded engine)
+store = create_storage(os.environ)
+
+# List pages, keyed on per-collection write versions (see cache.py). Other
+# workers' Mongo writes don't bump this process's versions, so pages expire
+# after a few seconds there; the single-process memory engine never needs to.
+default_page_ttl = 0 if os.environ.get("STORAGE_BACKEND", "mongo").lower() == "memory" else 5
+page_cache = QueryCache(ttl=float(os.environ.get("PAGE_CACHE_TTL", default_page_ttl)))
+
+# Request profiler, only set up when PROFILER_ADMIN_TOKEN is configured (see profiler.py)
+profiler = Profiler.from_env(os.environ)
 
 # Create the main app without a prefix
 app = FastAPI()
@@ -32,13 +46,76 @@ def strip_mongo_id(doc: Dict[str, Any]) -> Dict[str, Any]:
         return doc
     doc = dict(doc)
     doc.pop("_id", None)
+    # Documents written before versioning have no version; they read as 0
+    doc.setdefault("version", 0)
     return doc
 
+def etag(version: int) -> str:
+    return f'"{version}"'
+
+def wants_minimal(prefer: Optional[str]) -> bool:
+    if not prefer:
+        return False
+    return any(p.strip() == "return=minimal" for part in prefer.split(",") for p in part.split(";"))
+
+def parse_if_match(if_match: Optional[str]) -> Optional[List[int]]:
+    """Versions listed in an If-Match header; None when absent or ``*``.
+
+    If-Match uses strong comparison, so weak (``W/``) and malformed tags are
+    dropped and can never match.
+    """
+    if not if_match or if_match.strip() == "*":
+        return None
+    versions = []
+    for tag in if_match.split(","):
+        tag = tag.strip()
+        if len(tag) > 2 and tag[0] == tag[-1] == '"' and tag[1:-1].isdigit():
+            versions.append(int(tag[1:-1]))
+    return versions
+
+async def apply_patch(collection: str, id: str, patch: BaseModel, not_found: str,
+                      if_match: Optional[str], minimal: bool) -> Optional[Dict[str, Any]]:
+    """Shared PATCH path: conditional on If-Match, bumps ``version``.
+
+    Returns the updated document, or None when ``minimal`` skips reading it back.
+    """
+    repo = getattr(store, collection)
+    update = {k: v for k, v in patch.model_dump(exclude_unset=True).items() if v is not None}
+    update["updated_at"] = datetime.utcnow()
+    query: Dict[str, Any] = {"_id": id}
+    expected = parse_if_match(if_match)
+    if expected is not None and 0 in expected:
+        # Version 0 is a document that has no version field yet
+        query["$or"] = [{"version": {"$in": expected}}, {"version": {"$exists": False}}]
+    elif expected is not None:
+        query["version"] = {"$in": expected}
+    ops = {"$set": update, "$inc": {"version": 1}}
+    if minimal:
+        found, res = await repo.update_one(query, ops), None
+    else:
+        res = await repo.find_one_and_update(query, ops)
+        found = res is not None
+    if not found:
+        if expected is not None and await repo.find_one({"_id": id}):
+            raise HTTPException(status_code=412, detail="If-Match does not match current version")
+        raise HTTPException(status_code=404, detail=not_found)
+    page_cache.bump(collection)
+    return res
+
+def minimal_response(if_match: Optional[str]) -> Response:
+    headers = {"Preference-Applied": "return=minimal"}
+    expected = parse_if_match(if_match)
+    # The new version is only known when exactly one tag could have matched
+    if expected is not None and len(expected) == 1:
+        headers["ETag"] = etag(expected[0] + 1)
+    return Response(status_code=204, headers=headers)
+
 # Base models
 class BaseDoc(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+    version: int = 1
     model_config = ConfigDict(extra="ignore")
 
 # Status check (existing)
@@ -59,12 +136,12 @@ async def create_status_check(input: StatusCheckCreate):
     status_obj = StatusCheck(**input.model_dump())
     d = status_obj.model_dump()
     d["_id"] = status_obj.id
-    await db.status_checks.insert_one(d)
+    await store.status_checks.insert_one(d)
     return status_obj
 
 @api_router.get("/status", response_model=List[StatusCheck])
 async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
+    status_checks = await store.status_checks.find(limit=1000)
     return [StatusCheck(**strip_mongo_id(x)) for x in status_checks]
 
 # Blogs
@@ -97,7 +174,8 @@ async def create_blog(b: BlogCreate):
     obj = Blog(**blog_data)
     d = obj.model_dump()
     d["_id"] = obj.id
-    await db.blogs.insert_one(d)
+    await store.blogs.insert_one(d)
+    page_cache.bump("blogs")
     return obj
 
 @api_router.get("/blogs")
@@ -105,6 +183,7 @@ async def list_blogs(search: Optional[str] = None, tags: Optional[str] = None, p
     page = max(page, 1)
     limit = min(max(limit, 1), 100)
     query: Dict[str, Any] = {}
+    tag_list: List[str] = []
     if search:
         query["$or"] = [
             {"title": {"$regex": search, "$options": "i"}},
@@ -112,36 +191,43 @@ async def list_blogs(search: Optional[str] = None, tags: Optional[str] = None, p
             {"tags": {"$regex": search, "$options": "i"}},
         ]
     if tags:
-        tag_list = [t.strip() for t in tags.split(',') if t.strip()]
+        tag_list = sorted({t.strip() for t in tags.split(',') if t.strip()})
         if tag_list:
             query["tags"] = {"$in": tag_list}
 
-    total = await db.blogs.count_documents(query)
-    cursor = db.blogs.find(query).sort("date", -1).skip((page - 1) * limit).limit(limit)
-    items = [Blog(**strip_mongo_id(x)) for x in await cursor.to_list(length=limit)]
-    return {"items": items, "page": page, "limit": limit, "total": total}
+    async def load():
+        total = await store.blogs.count_documents(query)
+        docs = await store.blogs.find(query, sort=("date", -1), skip=(page - 1) * limit, limit=limit)
+        items = [Blog(**strip_mongo_id(x)) for x in docs]
+        return {"items": items, "page": page, "limit": limit, "total": total}
+
+    key = ("list_blogs", search or None, tuple(tag_list), page, limit)
+    return await page_cache.get_or_load("blogs", key, load)
 
 @api_router.get("/blogs/{id}", response_model=Blog)
-async def get_blog(id: str):
-    doc = await db.blogs.find_one({"_id": id})
+async def get_blog(id: str, response: Response):
+    doc = await store.blogs.find_one({"_id": id})
     if not doc:
         raise HTTPException(status_code=404, detail="Blog not found")
-    return Blog(**strip_mongo_id(doc))
+    obj = Blog(**strip_mongo_id(doc))
+    response.headers["ETag"] = etag(obj.version)
+    return obj
 
 @api_router.patch("/blogs/{id}", response_model=Blog)
-async def update_blog(id: str, patch: BlogUpdate):
-    update = {k: v for k, v in patch.model_dump(exclude_unset=True).items() if v is not None}
-    update["updated_at"] = datetime.utcnow()
-    res = await db.blogs.find_one_and_update({"_id": id}, {"$set": update}, return_document=True)
-    if not res:
-        raise HTTPException(status_code=404, detail="Blog not found")
-    return Blog(**strip_mongo_id(res))
+async def update_blog(id: str, patch: BlogUpdate, response: Response, prefer: Optional[str] = Header(None), if_match: Optional[str] = Header(None)):
+    minimal = wants_minimal(prefer)
+    res = await apply_patch("blogs", id, patch, "Blog not found", if_match, minimal)
+    if minimal:
+        return minimal_response(if_match)
+    obj = Blog(**strip_mongo_id(res))
+    response.headers["ETag"] = etag(obj.version)
+    return obj
 
 @api_router.delete("/blogs/{id}")
 async def delete_blog(id: str):
-    res = await db.blogs.delete_one({"_id": id})
-    if res.deleted_count == 0:
+    if not await store.blogs.delete_one({"_id": id}):
         raise HTTPException(status_code=404, detail="Blog not found")
+    page_cache.bump("blogs")
     return {"ok": True}
 
 # Tools
@@ -170,7 +256,8 @@ class ToolUpdate(BaseModel):
 async def create_tool(t: ToolCreate):
     obj = Tool(**t.model_dump())
     d = obj.model_dump(); d["_id"] = obj.id
-    await db.tools.insert_one(d)
+    await store.tools.insert_one(d)
+    page_cache.bump("tools")
     return obj
 
 @api_router.get("/tools")
@@ -180,33 +267,41 @@ async def list_tools(category: Optional[str] = None, sort: str = Query("name", p
     query: Dict[str, Any] = {}
     if category and category.lower() != "all":
         query["category"] = category
-    total = await db.tools.count_documents(query)
     sort_field = "name" if sort == "name" else "category"
-    cursor = db.tools.find(query).sort(sort_field, 1).skip((page - 1) * limit).limit(limit)
-    items = [Tool(**strip_mongo_id(x)) for x in await cursor.to_list(length=limit)]
-    return {"items": items, "page": page, "limit": limit, "total": total}
+
+    async def load():
+        total = await store.tools.count_documents(query)
+        docs = await store.tools.find(query, sort=(sort_field, 1), skip=(page - 1) * limit, limit=limit)
+        items = [Tool(**strip_mongo_id(x)) for x in docs]
+        return {"items": items, "page": page, "limit": limit, "total": total}
+
+    key = ("list_tools", query.get("category"), sort_field, page, limit)
+    return await page_cache.get_or_load("tools", key, load)
 
 @api_router.get("/tools/{id}", response_model=Tool)
-async def get_tool(id: str):
-    doc = await db.tools.find_one({"_id": id})
+async def get_tool(id: str, response: Response):
+    doc = await store.tools.find_one({"_id": id})
     if not doc:
         raise HTTPException(status_code=404, detail="Tool not found")
-    return Tool(**strip_mongo_id(doc))
+    obj = Tool(**strip_mongo_id(doc))
+    response.headers["ETag"] = etag(obj.version)
+    return obj
 
 @api_router.patch("/tools/{id}", response_model=Tool)
-async def update_tool(id: str, patch: ToolUpdate):
-    update = {k: v for k, v in patch.model_dump(exclude_unset=True).items() if v is not None}
-    update["updated_at"] = datetime.utcnow()
-    res = await db.tools.find_one_and_update({"_id": id}, {"$set": update}, return_document=True)
-    if not res:
-        raise HTTPException(status_code=404, detail="Tool not found")
-    return Tool(**strip_mongo_id(res))
+async def update_tool(id: str, patch: ToolUpdate, response: Response, prefer: Optional[str] = Header(None), if_match: Optional[str] = Header(None)):
+    minimal = wants_minimal(prefer)
+    res = await apply_patch("tools", id, patch, "Tool not found", if_match, minimal)
+    if minimal:
+        return minimal_response(if_match)
+    obj = Tool(**strip_mongo_id(res))
+    response.headers["ETag"] = etag(obj.version)
+    return obj
 
 @api_router.delete("/tools/{id}")
 async def delete_tool(id: str):
-    res = await db.tools.delete_one({"_id": id})
-    if res.deleted_count == 0:
+    if not await store.tools.delete_one({"_id": id}):
         raise HTTPException(status_code=404, detail="Tool not found")
+    page_cache.bump("tools")
     return {"ok": True}
 
 # Path
@@ -226,28 +321,33 @@ class PathStepUpdate(BaseModel):
 async def create_path_step(p: PathStepCreate):
     obj = PathStep(**p.model_dump())
     d = obj.model_dump(); d["_id"] = obj.id
-    await db.path.insert_one(d)
+    await store.path.insert_one(d)
+    page_cache.bump("path")
     return obj
 
 @api_router.get("/path", response_model=List[PathStep])
 async def list_path():
-    items = await db.path.find().sort("created_at", 1).to_list(1000)
-    return [PathStep(**strip_mongo_id(x)) for x in items]
+    async def load():
+        items = await store.path.find(sort=("created_at", 1), limit=1000)
+        return [PathStep(**strip_mongo_id(x)) for x in items]
+
+    return await page_cache.get_or_load("path", ("list_path",), load)
 
 @api_router.patch("/path/{id}", response_model=PathStep)
-async def update_path_step(id: str, patch: PathStepUpdate):
-    update = {k: v for k, v in patch.model_dump(exclude_unset=True).items() if v is not None}
-    update["updated_at"] = datetime.utcnow()
-    res = await db.path.find_one_and_update({"_id": id}, {"$set": update}, return_document=True)
-    if not res:
-        raise HTTPException(status_code=404, detail="Path step not found")
-    return PathStep(**strip_mongo_id(res))
+async def update_path_step(id: str, patch: PathStepUpdate, response: Response, prefer: Optional[str] = Header(None), if_match: Optional[str] = Header(None)):
+    minimal = wants_minimal(prefer)
+    res = await apply_patch("path", id, patch, "Path step not found", if_match, minimal)
+    if minimal:
+        return minimal_response(if_match)
+    obj = PathStep(**strip_mongo_id(res))
+    response.headers["ETag"] = etag(obj.version)
+    return obj
 
 @api_router.delete("/path/{id}")
 async def delete_path_step(id: str):
-    res = await db.path.delete_one({"_id": id})
-    if res.deleted_count == 0:
+    if not await store.path.delete_one({"_id": id}):
         raise HTTPException(status_code=404, detail="Path step not found")
+    page_cache.bump("path")
     return {"ok": True}
 
 # Community
@@ -270,14 +370,18 @@ class MessageCreate(BaseModel):
 
 @api_router.get("/community/channels", response_model=List[Channel])
 async def list_channels():
-    items = await db.channels.find().sort("name", 1).to_list(1000)
-    return [Channel(**strip_mongo_id(x)) for x in items]
+    async def load():
+        items = await store.channels.find(sort=("name", 1), limit=1000)
+        return [Channel(**strip_mongo_id(x)) for x in items]
+
+    return await page_cache.get_or_load("channels", ("list_channels",), load)
 
 @api_router.post("/community/channels", response_model=Channel)
 async def create_channel(c: ChannelCreate):
     obj = Channel(**c.model_dump())
     d = obj.model_dump(); d["_id"] = obj.id
-    await db.channels.insert_one(d)
+    await store.channels.insert_one(d)
+    page_cache.bump("channels")
     return obj
 
 @api_router.get("/community/messages")
@@ -285,18 +389,107 @@ async def list_messages(channel: str = Query(...), page: int = 1, limit: int = 5
     page = max(page, 1)
     limit = min(max(limit, 1), 200)
     query = {"channel": channel}
-    total = await db.messages.count_documents(query)
-    cursor = db.messages.find(query).sort("ts", 1).skip((page - 1) * limit).limit(limit)
-    items = [Message(**strip_mongo_id(x)) for x in await cursor.to_list(length=limit)]
-    return {"items": items, "page": page, "limit": limit, "total": total}
+    async def load():
+        total = await store.messages.count_documents(query)
+        docs = await store.messages.find(query, sort=("ts", 1), skip=(page - 1) * limit, limit=limit)
+        items = [Message(**strip_mongo_id(x)) for x in docs]
+        return {"items": items, "page": page, "limit": limit, "total": total}
+
+    key = ("list_messages", channel, page, limit)
+    return await page_cache.get_or_load("messages", key, load)
 
 @api_router.post("/community/messages", response_model=Message)
 async def create_message(m: MessageCreate):
     obj = Message(**m.model_dump())
     d = obj.model_dump(); d["_id"] = obj.id
-    await db.messages.insert_one(d)
+    await store.messages.insert_one(d)
+    page_cache.bump("messages")
     return obj
 
+# Batch: several GETs against the routes above in one round trip
+BATCH_MAX_REQUESTS = 20
+
+class BatchItem(BaseModel):
+    id: Optional[str] = None
+    method: str = "GET"
+    path: str
+    params: Dict[str, Any] = {}
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem] = Field(..., min_length=1, max_length=BATCH_MAX_REQUESTS)
+
+async def dispatch_subrequest(parent: Request, item: BatchItem) -> Dict[str, Any]:
+    """Run one GET through the app in-process and capture its status and JSON body."""
+    result: Dict[str, Any] = {"id": item.id, "status": 400, "body": None}
+    url = urlsplit(item.path)
+    # Routing sees the decoded path, as it would for a direct request
+    path = unquote(url.path)
+    if item.method.upper() != "GET":
+        result["body"] = {"detail": "Only GET sub-requests are supported"}
+        return result
+    if "#" in item.path:
+        result["body"] = {"detail": "Sub-request path must not contain a fragment"}
+        return result
+    if not path.startswith("/api/") or path.rstrip("/") == "/api/batch":
+        result["body"] = {"detail": "Sub-request path must be an /api/ route other than /api/batch"}
+        return result
+    query = "&".join(q for q in (url.query, urlencode(item.params, doseq=True)) if q)
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": parent.url.scheme, "path": path, "raw_path": url.path.encode(),
+        "query_string": query.encode(), "root_path": parent.scope.get("root_path", ""),
+        "headers": [(b"host", parent.headers.get("host", "").encode()), (b"accept", b"application/json")],
+        "client": parent.scope.get("client"), "server": parent.scope.get("server"),
+    }
+    chunks: List[bytes] = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    try:
+        await app(scope, receive, send)
+    except Exception:
+        logger.exception("Batch sub-request failed: %s", item.path)
+        result["status"] = 500
+        chunks = [b'{"detail": "Internal Server Error"}']
+    body = b"".join(chunks)
+    try:
+        result["body"] = json.loads(body) if body else None
+    except ValueError:
+        result["body"] = body.decode("utf-8", "replace")
+    return result
+
+@api_router.post("/batch")
+async def batch(request: Request, b: BatchRequest):
+    responses = await asyncio.gather(*(dispatch_subrequest(request, item) for item in b.requests))
+    return {"responses": responses}
+
+# Admin: request profiles
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="Profiler disabled")
+    if not profiler.is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@api_router.get("/admin/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles():
+    return [p.summary() for p in reversed(profiler.profiles)]
+
+@api_router.get("/admin/profiles/{id}", dependencies=[Depends(require_admin)])
+async def get_profile(id: str, format: str = Query("speedscope", pattern="^(speedscope|collapsed)$")):
+    session = profiler.get(id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "collapsed":
+        return PlainTextResponse(session.collapsed())
+    return session.speedscope()
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -306,8 +499,13 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Preference-Applied", "X-Profile-Id"],
 )
 
+if profiler is not None:
+    profiler.routes = app.routes
+    app.add_middleware(ProfilerMiddleware, profiler=profiler)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -315,6 +513,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def install_profiler():
+    if profiler is not None:
+        profiler.install_task_factory(asyncio.get_running_loop())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    store.close()
\ No newline at end of file
@@ -0,0 +1,335 @@
+"""Storage backends for the API collections.
+
+Handlers talk to a ``Repository`` per collection instead of ``db.<collection>``.
+Queries and updates use the small subset of Mongo syntax the API needs
+(equality, ``$in``, ``$regex``/``$options``, ``$exists``, ``$or``; ``$set``/``$inc`` updates) so the
+same handler code runs against Mongo or the embedded in-memory engine.
+
+Select the backend with ``STORAGE_BACKEND=mongo`` (default) or ``memory``.
+With Mongo, ``ID_STORAGE=binary`` stores ids once as BSON UUIDs (Binary
+subtype 4) instead of duplicated ``_id``/``id`` strings; repositories always
+hand back documents with string ``_id`` and ``id``.
+"""
+import heapq
+import itertools
+import re
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+COLLECTIONS = ("status_checks", "blogs", "tools", "path", "channels", "messages")
+
+# Equality-filtered fields that get a secondary index in the memory backend
+MEMORY_INDEXES: Dict[str, Tuple[str, ...]] = {
+    "blogs": ("tags",),
+    "tools": ("category",),
+    "messages": ("channel",),
+}
+
+Sort = Optional[Tuple[str, int]]
+
+
+class Repository(ABC):
+    """Async collection interface shared by all backends."""
+
+    @abstractmethod
+    async def insert_one(self, doc: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def find_one(self, query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def find(self, query: Optional[Dict[str, Any]] = None, sort: Sort = None,
+                   skip: int = 0, limit: int = 0) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def count_documents(self, query: Dict[str, Any]) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def find_one_and_update(self, query: Dict[str, Any], update: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Apply ``update`` to the first match and return the updated document."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_one(self, query: Dict[str, Any], update: Dict[str, Any]) -> bool:
+        """Apply ``update`` to the first match without reading it back; True if one matched."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_one(self, query: Dict[str, Any]) -> bool:
+        raise NotImplementedError
+
+
+# Mongo (Motor)
+def to_uuid(value: Any) -> Any:
+    """UUID for a valid UUID string, otherwise the value unchanged."""
+    if isinstance(value, str):
+        try:
+            return uuid.UUID(value)
+        except ValueError:
+            pass
+    return value
+
+
+class MongoRepository(Repository):
+    """Motor collection; with ``binary_ids`` new ids are stored as UUIDs.
+
+    Reads and ``_id`` lookups accept both the UUID and the string form in
+    either mode, so the app keeps working while migrate_uuid_ids.py runs and
+    after switching ``ID_STORAGE`` back to ``string``.
+    """
+
+    def __init__(self, collection, binary_ids: bool = False):
+        self.collection = collection
+        self.binary_ids = binary_ids
+
+    def _query(self, query):
+        if not isinstance(query.get("_id"), str):
+            return query
+        stored = to_uuid(query["_id"])
+        if stored is query["_id"]:
+            return query
+        return {**query, "_id": {"$in": [stored, query["_id"]]}}
+
+    def _decode(self, doc):
+        if doc is None:
+            return doc
+        if isinstance(doc["_id"], uuid.UUID):
+            doc["_id"] = str(doc["_id"])
+        doc.setdefault("id", doc["_id"])
+        return doc
+
+    async def insert_one(self, doc):
+        if self.binary_ids:
+            doc = {k: v for k, v in doc.items() if k != "id"}
+            doc["_id"] = to_uuid(doc["_id"])
+        await self.collection.insert_one(doc)
+
+    async def find_one(self, query):
+        return self._decode(await self.collection.find_one(self._query(query)))
+
+    async def find(self, query=None, sort=None, skip=0, limit=0):
+        cursor = self.collection.find(self._query(query or {}))
+        if sort:
+            cursor = cursor.sort(*sort)
+        if skip:
+            cursor = cursor.skip(skip)
+        if limit:
+            cursor = cursor.limit(limit)
+        return [self._decode(d) for d in await cursor.to_list(length=limit or None)]
+
+    async def count_documents(self, query):
+        return await self.collection.count_documents(self._query(query))
+
+    async def find_one_and_update(self, query, update):
+        res = await self.collection.find_one_and_update(self._query(query), update, return_document=True)
+        return self._decode(res)
+
+    async def update_one(self, query, update):
+        res = await self.collection.update_one(self._query(query), update)
+        return res.matched_count > 0
+
+    async def delete_one(self, query):
+        stored = self._query(query)
+        if stored is query:
+            res = await self.collection.delete_one(stored)
+        else:
+            # Mid-migration both id forms of one document can exist; remove both
+            res = await self.collection.delete_many(stored)
+        return res.deleted_count > 0
+
+
+# Embedded in-memory engine
+#
+# Matches Mongo on the semantics the handlers rely on:
+# - a missing field compares equal to None, so {"f": None} and {"f": {"$in": [None]}} match it;
+#   only $exists tells it apart from an explicit None
+# - equality, $in and $regex on a list field match if any element does
+# - $regex only matches string values
+# - missing values sort before everything else (first ascending, last descending)
+def _values(doc: Dict[str, Any], field: str) -> List[Any]:
+    v = doc.get(field)
+    return list(v) if isinstance(v, list) else [v]
+
+
+def _match_condition(doc: Dict[str, Any], field: str, cond: Any) -> bool:
+    values = _values(doc, field)
+    if isinstance(cond, dict) and any(k.startswith("$") for k in cond):
+        for op, arg in cond.items():
+            if op == "$exists":
+                if (field in doc) != bool(arg):
+                    return False
+            elif op == "$in":
+                if not any(v in arg for v in values):
+                    return False
+            elif op == "$regex":
+                flags = re.IGNORECASE if "i" in cond.get("$options", "") else 0
+                rx = re.compile(arg, flags)
+                if not any(isinstance(v, str) and rx.search(v) for v in values):
+                    return False
+            elif op == "$options":
+                continue
+            else:
+                raise ValueError(f"Unsupported query operator: {op}")
+        return True
+    return cond in values
+
+
+def matches(doc: Dict[str, Any], query: Dict[str, Any]) -> bool:
+    for key, cond in query.items():
+        if key == "$or":
+            if not any(matches(doc, sub) for sub in cond):
+                return False
+        elif not _match_condition(doc, key, cond):
+            return False
+    return True
+
+
+def _sort_key(value: Any) -> Tuple[int, Any]:
+    # Missing values sort first, as in Mongo
+    return (0, 0) if value is None else (1, value)
+
+
+class MemoryRepository(Repository):
+    """Dict-backed collection with secondary indexes on equality fields.
+
+    Documents are kept by ``_id``; each indexed field maps a value to the set
+    of ``_id``s holding it (list fields are indexed per element), so filters
+    on those fields only scan the candidate set. Candidates are visited in
+    insertion order either way, so ties in a sort don't depend on set order.
+    """
+
+    def __init__(self, indexes: Iterable[str] = ()):
+        self.docs: Dict[Any, Dict[str, Any]] = {}
+        self.indexes: Dict[str, Dict[Any, set]] = {f: {} for f in indexes}
+        self._seq: Dict[Any, int] = {}
+        self._counter = itertools.count()
+
+    def _index(self, doc, add: bool):
+        for field, index in self.indexes.items():
+            for v in set(_values(doc, field)):
+                ids = index.setdefault(v, set())
+                if add:
+                    ids.add(doc["_id"])
+                else:
+                    ids.discard(doc["_id"])
+                    if not ids:
+                        del index[v]
+
+    def _candidates(self, query) -> Iterable[Dict[str, Any]]:
+        if "_id" in query and not isinstance(query["_id"], dict):
+            doc = self.docs.get(query["_id"])
+            return [doc] if doc else []
+        best = None
+        for field, index in self.indexes.items():
+            cond = query.get(field)
+            if cond is None:
+                continue
+            if isinstance(cond, dict):
+                if set(cond) != {"$in"}:
+                    continue
+                ids = set().union(*(index.get(v, ()) for v in cond["$in"]))
+            else:
+                ids = index.get(cond, set())
+            if best is None or len(ids) < len(best):
+                best = ids
+        if best is None:
+            return self.docs.values()
+        return [self.docs[i] for i in sorted(best, key=self._seq.__getitem__)]
+
+    def _matching(self, query) -> List[Dict[str, Any]]:
+        query = query or {}
+        return [d for d in self._candidates(query) if matches(d, query)]
+
+    async def insert_one(self, doc):
+        if doc["_id"] in self.docs:
+            raise ValueError(f"Duplicate _id: {doc['_id']}")
+        doc = dict(doc)
+        self.docs[doc["_id"]] = doc
+        self._seq[doc["_id"]] = next(self._counter)
+        self._index(doc, add=True)
+
+    async def find_one(self, query):
+        found = self._matching(query)
+        return dict(found[0]) if found else None
+
+    async def find(self, query=None, sort=None, skip=0, limit=0):
+        found = self._matching(query)
+        if sort:
+            field, direction = sort
+            key = lambda d: _sort_key(d.get(field))  # noqa: E731
+            if limit:
+                pick = heapq.nlargest if direction < 0 else heapq.nsmallest
+                found = pick(skip + limit, found, key=key)
+            else:
+                found.sort(key=key, reverse=direction < 0)
+        found = found[skip:skip + limit] if limit else found[skip:]
+        return [dict(d) for d in found]
+
+    async def count_documents(self, query):
+        return len(self._matching(query))
+
+    def _apply(self, doc, update) -> Dict[str, Any]:
+        self._index(doc, add=False)
+        for op, fields in update.items():
+            if op == "$set":
+                doc.update(fields)
+            elif op == "$inc":
+                for k, n in fields.items():
+                    doc[k] = doc.get(k, 0) + n
+            else:
+                raise ValueError(f"Unsupported update operator: {op}")
+        self._index(doc, add=True)
+        return doc
+
+    async def find_one_and_update(self, query, update):
+        found = self._matching(query)
+        return dict(self._apply(found[0], update)) if found else None
+
+    async def update_one(self, query, update):
+        found = self._matching(query)
+        if found:
+            self._apply(found[0], update)
+        return bool(found)
+
+    async def delete_one(self, query):
+        found = self._matching(query)
+        if not found:
+            return False
+        doc = found[0]
+        self._index(doc, add=False)
+        del self.docs[doc["_id"]]
+        del self._seq[doc["_id"]]
+        return True
+
+
+class Storage:
+    """One repository per collection, e.g. ``store.blogs``."""
+
+    def __init__(self, repos: Dict[str, Repository], close=None):
+        self.repos = repos
+        self._close = close
+        for name, repo in repos.items():
+            setattr(self, name, repo)
+
+    def close(self):
+        if self._close:
+            self._close()
+
+
+def create_storage(env) -> Storage:
+    backend = env.get("STORAGE_BACKEND", "mongo").lower()
+    if backend == "memory":
+        return Storage({name: MemoryRepository(MEMORY_INDEXES.get(name, ())) for name in COLLECTIONS})
+    if backend == "mongo":
+        from motor.motor_asyncio import AsyncIOMotorClient
+        binary_ids = env.get("ID_STORAGE", "string").lower() == "binary"
+        client = AsyncIOMotorClient(env["MONGO_URL"], uuidRepresentation="standard")
+        db = client[env["DB_NAME"]]
+        repos = {name: MongoRepository(db[name], binary_ids) for name in COLLECTIONS}
+        return Storage(repos, close=client.close)
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Write Path Benchmark
+Compares PATCH throughput for full-body responses, Prefer: return=minimal,
+and If-Match conditional updates against a running backend.
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+# Load backend URL from frontend .env
+def load_backend_url():
+    frontend_env = Path("/app/frontend/.env")
+    if frontend_env.exists():
+        with open(frontend_env) as f:
+            for line in f:
+                if line.startswith("REACT_APP_BACKEND_URL="):
+                    return line.split("=", 1)[1].strip()
+    return "http://localhost:8001"
+
+API_URL = f"{load_backend_url()}/api"
+
+def create_blogs(session, n):
+    ids = []
+    for i in range(n):
+        r = session.post(f"{API_URL}/blogs", json={
+            "title": f"Bench {i}", "excerpt": "Write path benchmark", "tags": ["bench"], "author": "bench"
+        }, timeout=15)
+        r.raise_for_status()
+        ids.append(r.json()["id"])
+    return ids
+
+def worker(blog_id, mode, ops):
+    """Patch one blog ``ops`` times; each worker owns its blog so If-Match never conflicts."""
+    session = requests.Session()
+    headers = {}
+    if mode in ("minimal", "conditional"):
+        headers["Prefer"] = "return=minimal"
+    version = None
+    if mode == "conditional":
+        version = session.get(f"{API_URL}/blogs/{blog_id}", timeout=15).headers["ETag"]
+    for i in range(ops):
+        if version:
+            headers["If-Match"] = version
+        r = session.patch(f"{API_URL}/blogs/{blog_id}", json={"title": f"Bench {i}"}, headers=headers, timeout=15)
+        if r.status_code not in (200, 204):
+            raise RuntimeError(f"{mode}: unexpected status {r.status_code}: {r.text}")
+        if version:
+            version = r.headers["ETag"]
+
+def run(mode, ids, ops):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(ids)) as pool:
+        list(pool.map(lambda b: worker(b, mode, ops), ids))
+    elapsed = time.perf_counter() - start
+    return len(ids) * ops / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=250, help="PATCHes per worker")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    session = requests.Session()
+    ids = create_blogs(session, args.concurrency)
+    print(f"Benchmarking {API_URL} with {args.concurrency} workers x {args.ops} PATCHes, best of {args.rounds}")
+    try:
+        results = {}
+        for mode in ("full", "minimal", "conditional"):
+            results[mode] = max(run(mode, ids, args.ops) for _ in range(args.rounds))
+        base = results["full"]
+        for mode, rate in results.items():
+            print(f"{mode:12s} {rate:9.1f} writes/s  ({rate / base:.2f}x)")
+    finally:
+        for blog_id in ids:
+            session.delete(f"{API_URL}/blogs/{blog_id}", timeout=15)
+
+if __name__ == "__main__":
+    main()
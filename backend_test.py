@@ -48,18 +48,18 @@ def log_test(test_name, success, details=""):
         'details': details
     })
 
-def make_request(method, endpoint, data=None, params=None):
+def make_request(method, endpoint, data=None, params=None, headers=None):
     """Make HTTP request with error handling"""
     url = f"{API_URL}{endpoint}"
     try:
         if method == "GET":
-            response = requests.get(url, params=params, timeout=15)
+            response = requests.get(url, params=params, headers=headers, timeout=15)
         elif method == "POST":
-            response = requests.post(url, json=data, timeout=15)
+            response = requests.post(url, json=data, headers=headers, timeout=15)
         elif method == "PATCH":
-            response = requests.patch(url, json=data, timeout=15)
+            response = requests.patch(url, json=data, headers=headers, timeout=15)
         elif method == "DELETE":
-            response = requests.delete(url, timeout=15)
+            response = requests.delete(url, headers=headers, timeout=15)
         else:
             raise ValueError(f"Unsupported method: {method}")
         
@@ -71,6 +71,67 @@ def make_request(method, endpoint, data=None, params=None):
         print(f"Request failed: {e}")
         return None
 
+def test_conditional_writes(name, endpoint, update_data, list_endpoint=None):
+    """Test ETag, If-Match and Prefer: return=minimal on PATCH {endpoint}
+
+    Collections without a single-item GET pass ``list_endpoint``; the version
+    is then read from that listing instead of an ETag.
+    """
+    prefix = f"PATCH /api{endpoint.rsplit('/', 1)[0]}/{{id}}"
+    
+    if list_endpoint:
+        response = make_request("GET", list_endpoint)
+        item_id = endpoint.rsplit("/", 1)[1]
+        item = next((x for x in response.json() if x.get("id") == item_id), None) if response is not None and response.status_code == 200 else None
+        if item is None or not isinstance(item.get("version"), int):
+            log_test(f"GET /api{list_endpoint} lists {name} version", False, f"Item: {item}")
+            return
+        version = item["version"]
+        etag = f'"{version}"'
+        log_test(f"GET /api{list_endpoint} lists {name} version", True, f"version: {version}")
+    else:
+        response = make_request("GET", endpoint)
+        if response is None or response.status_code != 200 or not response.headers.get("ETag"):
+            log_test(f"GET {name} returns ETag", False, f"Status: {response.status_code if response is not None else 'No response'}")
+            return
+        version = response.json().get("version")
+        etag = response.headers["ETag"]
+        log_test(f"GET {name} returns ETag", etag == f'"{version}"', f"ETag: {etag}, version: {version}")
+    
+    # Minimal return with a matching If-Match
+    response = make_request("PATCH", endpoint, update_data, headers={"If-Match": etag, "Prefer": "return=minimal"})
+    if response is not None and response.status_code == 204:
+        ok = (response.headers.get("Preference-Applied") == "return=minimal"
+              and response.headers.get("ETag") == f'"{version + 1}"' and not response.content)
+        log_test(f"{prefix} with Prefer: return=minimal returns 204", ok, f"Headers: {dict(response.headers)}")
+    else:
+        log_test(f"{prefix} with Prefer: return=minimal returns 204", False, f"Status: {response.status_code if response is not None else 'No response'}")
+    
+    # The ETag used above is now stale
+    response = make_request("PATCH", endpoint, update_data, headers={"If-Match": etag})
+    log_test(f"{prefix} with stale If-Match returns 412", response is not None and response.status_code == 412,
+             f"Status: {response.status_code if response is not None else 'No response'}")
+    
+    # If-Match lists match on any entry
+    response = make_request("PATCH", endpoint, update_data, headers={"If-Match": f'"999999", "{version + 1}"'})
+    if response is not None and response.status_code == 200:
+        ok = response.headers.get("ETag") == f'"{version + 2}"' and response.json().get("version") == version + 2
+        log_test(f"{prefix} with If-Match list returns 200 and new ETag", ok, f"ETag: {response.headers.get('ETag')}")
+    else:
+        log_test(f"{prefix} with If-Match list returns 200 and new ETag", False, f"Status: {response.status_code if response is not None else 'No response'}")
+    
+    # Strong comparison: weak and malformed tags never match
+    for label, value in (("weak", f'W/"{version + 2}"'), ("malformed", "not-a-version")):
+        response = make_request("PATCH", endpoint, update_data, headers={"If-Match": value})
+        log_test(f"{prefix} with {label} If-Match returns 412", response is not None and response.status_code == 412,
+                 f"Status: {response.status_code if response is not None else 'No response'}")
+    
+    # A missing id is 404 even when conditional
+    missing = endpoint.rsplit("/", 1)[0] + "/non-existing-id-12345"
+    response = make_request("PATCH", missing, update_data, headers={"If-Match": f'"{version + 2}"'})
+    log_test(f"{prefix} with If-Match on missing id returns 404", response is not None and response.status_code == 404,
+             f"Status: {response.status_code if response is not None else 'No response'}")
+
 def test_general_endpoints():
     """Test general API endpoints"""
     print("\n=== Testing General Endpoints ===")
@@ -147,6 +208,9 @@ def test_blogs():
         else:
             log_test("PATCH /api/blogs/{id} updates blog", False, f"Status: {response.status_code if response else 'No response'}")
         
+        # Test conditional and minimal PATCH /api/blogs/{id}
+        test_conditional_writes("/api/blogs/{id}", f"/blogs/{created_ids['blog']}", update_data)
+        
         # Test GET /api/blogs/{id} after update
         response = make_request("GET", f"/blogs/{created_ids['blog']}")
         if response and response.status_code == 200:
@@ -248,6 +312,9 @@ def test_tools():
         else:
             log_test("PATCH /api/tools/{id} updates tool", False, f"Status: {response.status_code if response else 'No response'}")
         
+        # Test conditional and minimal PATCH /api/tools/{id}
+        test_conditional_writes("/api/tools/{id}", f"/tools/{created_ids['tool']}", update_data)
+        
         # Test GET /api/tools/{id} after update
         response = make_request("GET", f"/tools/{created_ids['tool']}")
         if response and response.status_code == 200:
@@ -316,6 +383,8 @@ def test_path():
                 log_test("PATCH /api/path/{id} updates step", False, f"Label not updated: {data.get('label')}")
         else:
             log_test("PATCH /api/path/{id} updates step", False, f"Status: {response.status_code if response else 'No response'}")
+        
+        test_conditional_writes("/api/path/{id}", f"/path/{created_ids['path']}", update_data, list_endpoint="/path")
     
     # Test DELETE /api/path/{id}
     if created_ids['path']:
@@ -426,6 +495,53 @@ def test_edge_cases():
     else:
         log_test("GET /api/tools with invalid sort returns validation error", False, f"Status: {response.status_code if response else 'No response'}")
 
+def test_batch():
+    """Test composite batch endpoint"""
+    print("\n=== Testing Batch Endpoint ===")
+    
+    batch_data = {"requests": [
+        {"id": "root", "path": "/api/"},
+        {"id": "channels", "path": "/api/community/channels"},
+        {"id": "blogs", "path": "/api/blogs", "params": {"page": 1, "limit": 5}},
+        {"id": "missing", "path": "/api/blogs/non-existing-id-12345"},
+    ]}
+    response = make_request("POST", "/batch", batch_data)
+    if response and response.status_code == 200:
+        results = {r.get("id"): r for r in response.json().get("responses", [])}
+        ok = (
+            results.get("root", {}).get("status") == 200
+            and results["root"].get("body", {}).get("message") == "Hello World"
+            and results.get("channels", {}).get("status") == 200
+            and isinstance(results["channels"].get("body"), list)
+            and results.get("blogs", {}).get("status") == 200
+            and "items" in (results["blogs"].get("body") or {})
+            and results.get("missing", {}).get("status") == 404
+        )
+        log_test("POST /api/batch resolves sub-requests with per-item status", ok, f"Statuses: { {k: v.get('status') for k, v in results.items()} }")
+    else:
+        log_test("POST /api/batch resolves sub-requests with per-item status", False, f"Status: {response.status_code if response else 'No response'}")
+    
+    # Writes are rejected per item, not for the whole batch
+    response = make_request("POST", "/batch", {"requests": [{"method": "POST", "path": "/api/blogs"}]})
+    if response and response.status_code == 200:
+        status = response.json()["responses"][0].get("status")
+        log_test("POST /api/batch rejects non-GET sub-requests", status == 400, f"Sub-request status: {status}")
+    else:
+        log_test("POST /api/batch rejects non-GET sub-requests", False, f"Status: {response.status_code if response else 'No response'}")
+    
+    # A raw "#" starts a fragment; channel names go in params, and paths may be percent-encoded
+    response = make_request("POST", "/batch", {"requests": [
+        {"id": "fragment", "path": "/api/community/messages?channel=#general"},
+        {"id": "params", "path": "/api/community/messages", "params": {"channel": "#general"}},
+        {"id": "encoded", "path": "/api/%62logs"},
+    ]})
+    if response is not None and response.status_code == 200:
+        statuses = {r.get("id"): r.get("status") for r in response.json()["responses"]}
+        ok = statuses == {"fragment": 400, "params": 200, "encoded": 200}
+        log_test("POST /api/batch rejects fragments and decodes paths", ok, f"Statuses: {statuses}")
+    else:
+        log_test("POST /api/batch rejects fragments and decodes paths", False, f"Status: {response.status_code if response is not None else 'No response'}")
+
 def print_summary():
     """Print test summary"""
     print("\n" + "="*50)
@@ -462,6 +578,7 @@ def main():
         test_path()
         test_community()
         test_edge_cases()
+        test_batch()
         
         success = print_summary()
         sys.exit(0 if success else 1)
@@ -0,0 +1,12 @@
+import os
+import sys
+from pathlib import Path
+
+# The backend modules import each other flat (``from storage import ...``)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+# server.py reads these at import time
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("PROFILER_ADMIN_TOKEN", "test-admin-token")
+os.environ.setdefault("PROFILE_SAMPLE", "/api/blogs/{id}=1")
+os.environ.setdefault("PROFILE_INTERVAL_MS", "1")
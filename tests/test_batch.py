@@ -0,0 +1,40 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(server.app) as c:
+        yield c
+
+
+def batch(client, *items):
+    r = client.post("/api/batch", json={"requests": list(items)})
+    assert r.status_code == 200
+    return {res["id"]: res for res in r.json()["responses"]}
+
+
+def test_channel_in_params_reaches_the_route(client):
+    client.post("/api/community/messages", json={"channel": "#batch", "author": "t", "text": "hi"})
+    res = batch(client, {"id": "m", "path": "/api/community/messages", "params": {"channel": "#batch"}})
+    assert res["m"]["status"] == 200
+    assert [m["text"] for m in res["m"]["body"]["items"]] == ["hi"]
+
+
+def test_fragment_is_rejected_per_item(client):
+    res = batch(client, {"id": "frag", "path": "/api/community/messages?channel=#batch"},
+                {"id": "ok", "path": "/api/"})
+    assert res["frag"]["status"] == 400
+    assert res["ok"]["status"] == 200
+
+
+def test_percent_encoded_path_is_decoded_for_routing(client):
+    r = client.post("/api/blogs", json={"title": "Encoded", "excerpt": "x", "author": "t"})
+    blog_id = r.json()["id"]
+    res = batch(client, {"id": "list", "path": "/api/%62logs"}, {"id": "one", "path": f"/api/blogs/{blog_id}"},
+                {"id": "nested", "path": "/api/%62atch"})
+    assert res["list"]["status"] == 200
+    assert res["one"]["body"]["id"] == blog_id
+    assert res["nested"]["status"] == 400
@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+import cache
+from cache import QueryCache
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class Loader:
+    """Counts calls and blocks each load until ``release`` is set."""
+
+    def __init__(self, value="page", error=None):
+        self.value = value
+        self.error = error
+        self.calls = 0
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        self.started.set()
+        await self.release.wait()
+        if self.error:
+            raise self.error
+        return f"{self.value}-{self.calls}"
+
+
+def test_concurrent_identical_calls_load_once():
+    async def main():
+        qc, load = QueryCache(), Loader()
+        waiters = [asyncio.ensure_future(qc.get_or_load("blogs", "k", load)) for _ in range(10)]
+        await load.started.wait()
+        load.release.set()
+        assert await asyncio.gather(*waiters) == ["page-1"] * 10
+        assert load.calls == 1
+        assert await qc.get_or_load("blogs", "k", load) == "page-1"
+        assert load.calls == 1
+    run(main())
+
+
+def test_bump_reloads_next_call():
+    async def main():
+        qc, load = QueryCache(), Loader()
+        load.release.set()
+        assert await qc.get_or_load("blogs", "k", load) == "page-1"
+        qc.bump("tools")
+        assert await qc.get_or_load("blogs", "k", load) == "page-1"
+        qc.bump("blogs")
+        assert await qc.get_or_load("blogs", "k", load) == "page-2"
+    run(main())
+
+
+def test_bump_during_load_does_not_store_stale_page():
+    async def main():
+        qc, load = QueryCache(), Loader()
+        first = asyncio.ensure_future(qc.get_or_load("blogs", "k", load))
+        await load.started.wait()
+        qc.bump("blogs")
+        load.release.set()
+        assert await first == "page-1"
+        assert await qc.get_or_load("blogs", "k", load) == "page-2"
+        assert load.calls == 2
+    run(main())
+
+
+def test_loader_error_reaches_all_waiters_and_is_not_cached():
+    async def main():
+        qc, load = QueryCache(), Loader(error=RuntimeError("db down"))
+        waiters = [asyncio.ensure_future(qc.get_or_load("blogs", "k", load)) for _ in range(3)]
+        await load.started.wait()
+        load.release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert load.calls == 1
+        load.error = None
+        assert await qc.get_or_load("blogs", "k", load) == "page-2"
+    run(main())
+
+
+def test_cancelled_waiter_does_not_cancel_shared_load():
+    async def main():
+        qc, load = QueryCache(), Loader()
+        leaving = asyncio.ensure_future(qc.get_or_load("blogs", "k", load))
+        staying = asyncio.ensure_future(qc.get_or_load("blogs", "k", load))
+        await load.started.wait()
+        leaving.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leaving
+        load.release.set()
+        assert await staying == "page-1"
+        assert load.calls == 1
+    run(main())
+
+
+def test_ttl_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+
+    async def main():
+        qc, load = QueryCache(ttl=5), Loader()
+        load.release.set()
+        assert await qc.get_or_load("blogs", "k", load) == "page-1"
+        now[0] += 4
+        assert await qc.get_or_load("blogs", "k", load) == "page-1"
+        now[0] += 6
+        assert await qc.get_or_load("blogs", "k", load) == "page-2"
+    run(main())
+
+
+def test_lru_eviction():
+    async def main():
+        qc, load = QueryCache(max_entries=2), Loader()
+        load.release.set()
+        for key in ("a", "b", "a", "c"):
+            await qc.get_or_load("blogs", key, load)
+        assert [k for _, _, k in qc._pages] == ["a", "c"]
+    run(main())
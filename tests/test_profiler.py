@@ -0,0 +1,77 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+TOKEN = "test-admin-token"
+
+
+@pytest.fixture(scope="module")
+def client():
+    assert server.profiler is not None, "conftest.py sets PROFILER_ADMIN_TOKEN before importing server"
+    with TestClient(server.app) as c:
+        yield c
+
+
+@pytest.fixture
+def blog_id(client):
+    r = client.post("/api/blogs", json={"title": "Profiled", "excerpt": "x", "author": "t"})
+    assert r.status_code == 200
+    return r.json()["id"]
+
+
+def test_admin_routes_404_when_profiler_disabled(client, monkeypatch):
+    monkeypatch.setattr(server, "profiler", None)
+    r = client.get("/api/admin/profiles", headers={"X-Admin-Token": TOKEN})
+    assert r.status_code == 404
+
+
+def test_bad_admin_token_is_forbidden(client):
+    assert client.get("/api/admin/profiles").status_code == 403
+    assert client.get("/api/admin/profiles", headers={"X-Admin-Token": "nope"}).status_code == 403
+
+
+def test_profile_header_without_token_is_ignored(client):
+    r = client.get("/api/blogs", headers={"X-Profile": "1"})
+    assert r.status_code == 200
+    assert "X-Profile-Id" not in r.headers
+    r = client.get("/api/blogs", headers={"X-Profile": "1", "X-Admin-Token": "nope"})
+    assert "X-Profile-Id" not in r.headers
+
+
+def test_profiled_request_exports_collapsed_and_speedscope(client):
+    admin = {"X-Admin-Token": TOKEN}
+    r = client.get("/api/blogs", headers={"X-Profile": "1", **admin})
+    assert r.status_code == 200
+    profile_id = r.headers["X-Profile-Id"]
+
+    listed = client.get("/api/admin/profiles", headers=admin).json()
+    assert listed[0]["id"] == profile_id
+    assert listed[0]["path"] == "/api/blogs"
+    assert listed[0]["status"] == 200
+
+    collapsed = client.get(f"/api/admin/profiles/{profile_id}", params={"format": "collapsed"}, headers=admin)
+    assert collapsed.status_code == 200
+    assert collapsed.headers["content-type"].startswith("text/plain")
+    assert all(line.startswith("GET /api/blogs") for line in collapsed.text.strip().splitlines())
+
+    speedscope = client.get(f"/api/admin/profiles/{profile_id}", params={"format": "speedscope"}, headers=admin)
+    assert speedscope.status_code == 200
+    doc = speedscope.json()
+    assert doc["$schema"].startswith("https://www.speedscope.app/")
+    assert doc["profiles"][0]["type"] == "sampled"
+
+    assert client.get("/api/admin/profiles/missing", headers=admin).status_code == 404
+
+
+def test_sample_key_by_route_template(client, blog_id):
+    # conftest.py sets PROFILE_SAMPLE=/api/blogs/{id}=1
+    r = client.get(f"/api/blogs/{blog_id}")
+    assert r.status_code == 200
+    assert "X-Profile-Id" in r.headers
+    assert "X-Profile-Id" not in client.get("/api/tools").headers
+
+
+def test_stopped_session_drops_tasks(client):
+    r = client.get("/api/blogs", headers={"X-Profile": "1", "X-Admin-Token": TOKEN})
+    assert server.profiler.get(r.headers["X-Profile-Id"]).tasks == []
@@ -0,0 +1,92 @@
+import asyncio
+import random
+
+from storage import MemoryRepository
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def make_repo(docs, indexes=()):
+    repo = MemoryRepository(indexes)
+    for doc in docs:
+        run(repo.insert_one(doc))
+    return repo
+
+
+def ids(docs):
+    return [d["_id"] for d in docs]
+
+
+def test_missing_field_equals_none():
+    repo = make_repo([{"_id": "a", "version": 1}, {"_id": "b"}, {"_id": "c", "version": None}])
+    assert ids(run(repo.find({"version": None}))) == ["b", "c"]
+    assert ids(run(repo.find({"version": {"$in": [None, 1]}}))) == ["a", "b", "c"]
+    assert ids(run(repo.find({"version": {"$in": [None]}}))) == ["b", "c"]
+
+
+def test_exists_tells_missing_from_none():
+    repo = make_repo([{"_id": "a", "version": 1}, {"_id": "b"}, {"_id": "c", "version": None}])
+    assert ids(run(repo.find({"version": {"$exists": False}}))) == ["b"]
+    assert ids(run(repo.find({"version": {"$exists": True}}))) == ["a", "c"]
+
+
+def test_list_fields_match_per_element():
+    docs = [{"_id": "a", "tags": ["Python", "web"]}, {"_id": "b", "tags": ["rust"]}, {"_id": "c"}]
+    for indexes in ((), ("tags",)):
+        repo = make_repo(docs, indexes)
+        assert ids(run(repo.find({"tags": "web"}))) == ["a"]
+        assert ids(run(repo.find({"tags": {"$in": ["rust", "web"]}}))) == ["a", "b"]
+        assert ids(run(repo.find({"tags": {"$regex": "^py", "$options": "i"}}))) == ["a"]
+        assert ids(run(repo.find({"tags": {"$regex": "py"}}))) == []
+
+
+def test_or():
+    repo = make_repo([
+        {"_id": "a", "title": "Async IO", "excerpt": "loops"},
+        {"_id": "b", "title": "Rust", "excerpt": "async traits"},
+        {"_id": "c", "title": "Go", "excerpt": "channels"},
+    ])
+    query = {"$or": [{"title": {"$regex": "async", "$options": "i"}},
+                     {"excerpt": {"$regex": "async", "$options": "i"}}]}
+    assert ids(run(repo.find(query))) == ["a", "b"]
+    assert run(repo.count_documents(query)) == 2
+
+
+def test_missing_values_sort_first_ascending_last_descending():
+    repo = make_repo([{"_id": "a", "n": 2}, {"_id": "b"}, {"_id": "c", "n": 1}])
+    assert ids(run(repo.find(sort=("n", 1)))) == ["b", "c", "a"]
+    assert ids(run(repo.find(sort=("n", -1)))) == ["a", "c", "b"]
+
+
+def test_skip_limit_matches_full_sort():
+    rng = random.Random(7)
+    docs = [{"_id": f"d{i:02d}", "n": rng.choice([None, 1, 2, 3]), "tag": rng.choice(["x", "y"])}
+            for i in range(40)]
+    repo = make_repo(docs, ("tag",))
+    for query in ({}, {"tag": "x"}):
+        for direction in (1, -1):
+            full = run(repo.find(query, sort=("n", direction)))
+            for skip in (0, 3, 10):
+                for limit in (1, 5, 50):
+                    page = run(repo.find(query, sort=("n", direction), skip=skip, limit=limit))
+                    assert ids(page) == ids(full[skip:skip + limit])
+
+
+def test_index_upkeep_after_set_and_delete():
+    repo = make_repo([{"_id": "a", "category": "db"}, {"_id": "b", "category": "web"}], ("category",))
+    assert run(repo.update_one({"_id": "a"}, {"$set": {"category": "web"}}))
+    assert ids(run(repo.find({"category": "web"}))) == ["a", "b"]
+    assert run(repo.find({"category": "db"})) == []
+    assert "db" not in repo.indexes["category"]
+
+    assert run(repo.delete_one({"_id": "a"}))
+    assert ids(run(repo.find({"category": "web"}))) == ["b"]
+    assert repo.indexes["category"]["web"] == {"b"}
+    assert run(repo.find_one({"_id": "a"})) is None
+
+
+def test_inc_starts_missing_fields_at_zero():
+    repo = make_repo([{"_id": "a"}])
+    assert run(repo.find_one_and_update({"_id": "a"}, {"$inc": {"version": 1}}))["version"] == 1
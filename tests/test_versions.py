@@ -0,0 +1,57 @@
+import asyncio
+import uuid
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(server.app) as c:
+        yield c
+
+
+def insert_legacy_blog():
+    """A blog as written before documents carried a version."""
+    blog_id = str(uuid.uuid4())
+    now = datetime.utcnow()
+    asyncio.run(server.store.blogs.insert_one({
+        "_id": blog_id, "id": blog_id, "title": "Legacy", "excerpt": "x", "tags": [], "author": "t",
+        "date": now, "created_at": now, "updated_at": now,
+    }))
+    return blog_id
+
+
+def test_missing_version_reads_as_zero(client):
+    blog_id = insert_legacy_blog()
+    r = client.get(f"/api/blogs/{blog_id}")
+    assert r.json()["version"] == 0
+    assert r.headers["ETag"] == '"0"'
+
+
+def test_if_match_zero_matches_versionless_document_once(client):
+    blog_id = insert_legacy_blog()
+    r = client.patch(f"/api/blogs/{blog_id}", json={"title": "Edited"}, headers={"If-Match": '"0"'})
+    assert r.status_code == 200
+    assert r.headers["ETag"] == '"1"'
+    r = client.patch(f"/api/blogs/{blog_id}", json={"title": "Lost update"}, headers={"If-Match": '"0"'})
+    assert r.status_code == 412
+
+
+def test_unconditional_patch_moves_versionless_document_to_one(client):
+    blog_id = insert_legacy_blog()
+    r = client.patch(f"/api/blogs/{blog_id}", json={"title": "Edited"})
+    assert r.json()["version"] == 1
+    r = client.patch(f"/api/blogs/{blog_id}", json={"title": "Stale"}, headers={"If-Match": '"0"'})
+    assert r.status_code == 412
+
+
+def test_if_match_list_with_zero_and_minimal_return(client):
+    blog_id = insert_legacy_blog()
+    r = client.patch(f"/api/blogs/{blog_id}", json={"title": "Edited"},
+                     headers={"If-Match": '"7", "0"', "Prefer": "return=minimal"})
+    assert r.status_code == 204
+    assert client.get(f"/api/blogs/{blog_id}").json()["version"] == 1